@@ -1,28 +1,105 @@
 # Data cleaning script for ISM2411 project
 # This script loads raw sales data, cleans it, and outputs a processed CSV
 
+import re
+from pathlib import Path
+from typing import Iterable, Iterator, Optional, Union
+
 import pandas as pd
 import numpy as np
+from pandas.api.types import union_categoricals
+
+# pyarrow is optional: when installed, the CSV is parsed by its multithreaded
+# reader and text columns are kept as Arrow strings, whose .str methods run
+# as vectorized Arrow compute kernels instead of Python's `re` per cell.
+# The cleaned CSV is also written by Arrow's multithreaded CSV writer.
+try:
+    import pyarrow as pa
+    import pyarrow.csv as pacsv
+    HAS_PYARROW = True
+except ImportError:
+    HAS_PYARROW = False
+
+TEXT_DTYPE = 'string[pyarrow]' if HAS_PYARROW else str
+
+# Columns the pipeline works with (after cleaning the header names)
+NEEDED_COLUMNS = ['prodname', 'category', 'price', 'qty', 'date_sold']
+
+# Format of the raw date_sold values (ISO dates)
+DATE_FORMAT = '%Y-%m-%d'
+
+# Compiled once: whitespace runs, and a table that deletes double quotes
+_WS_RE = re.compile(r'\s+')
+_QUOTE_TABLE = str.maketrans('', '', '"')
+
+# Arrow's RE2 `\s` is ASCII only; add the rest of what Python's `\s` matches
+# (\v, \x1c-\x1f, \x85 and Unicode separators such as NBSP)
+_ARROW_WS_PATTERN = r'[\s\x0b\x1c-\x1f\x85\p{Z}]+'
+
+# Rows per chunk when streaming the raw CSV
+CHUNK_SIZE = 500_000
+
+# Grouped chunk results are folded into the running totals this often
+MERGE_EVERY = 8
+
+def _clean_name(name: str) -> str:
+    """Strip, lowercase and underscore one column name."""
+    return name.strip().lower().replace(' ', '_')
+
+def _to_float(values: pd.Series) -> np.ndarray:
+    """Convert raw values to a writable float64 array, with invalid/missing as NaN."""
+    # copy=True: under copy-on-write to_numpy() can return a read-only view,
+    # and the callers fix the values in place
+    return pd.to_numeric(values, errors='coerce').to_numpy(
+        dtype=np.float64, na_value=np.nan, copy=True
+    )
 
 # --- Function 1: Load data ---
-def load_data(file_path: str) -> pd.DataFrame:
+def load_data(
+    file_path: str,
+    chunksize: Optional[int] = None,
+    columns: Iterable[str] = NEEDED_COLUMNS,
+) -> Union[pd.DataFrame, Iterator[pd.DataFrame]]:
     """
     Load a CSV file into a pandas DataFrame.
 
-    What: Reads the raw sales CSV from the given path.
+    What: Reads the raw sales CSV from the given path. Only the given
+          `columns` (cleaned names) are read, and every value is read as text.
+          With `chunksize`, returns an iterator of DataFrames instead.
     Why: We need to bring raw data into Python for cleaning and processing.
+         The raw values are padded and quoted, so type sniffing cannot
+         succeed anyway; the cleaning steps do the numeric/date conversion.
+         Reading in chunks keeps memory use bounded on large files.
     """
     try:
-        df = pd.read_csv(file_path)
+        # Raw header names are messy, so match them on their cleaned form
+        header = pd.read_csv(file_path, nrows=0).columns
+        usecols = [
+            col for col in header
+            if _clean_name(col) in columns
+        ]
+        # The pyarrow engine cannot read in chunks, so streaming uses 'c'
+        use_pyarrow_engine = HAS_PYARROW and chunksize is None
+        df = pd.read_csv(
+            file_path,
+            usecols=usecols,
+            dtype=TEXT_DTYPE,
+            engine='pyarrow' if use_pyarrow_engine else 'c',
+            chunksize=chunksize,
+        )
+        if chunksize is not None:
+            print(f"Reading data from {file_path} in chunks of {chunksize} rows")
+            print(f"Columns: {usecols}")
+            return df
         print(f"Successfully loaded data from {file_path}")
         print(f"Shape: {df.shape}")
         return df
     except FileNotFoundError:
         print(f"Error: File not found at {file_path}")
-        return pd.DataFrame()  # Return empty DataFrame for error handling
     except Exception as e:
         print(f"Error loading file: {e}")
-        return pd.DataFrame()
+    # Return empty data for error handling
+    return iter(()) if chunksize is not None else pd.DataFrame()
 
 # --- Function 2: Clean column names ---
 def clean_column_names(df: pd.DataFrame) -> pd.DataFrame:
@@ -32,13 +109,16 @@ def clean_column_names(df: pd.DataFrame) -> pd.DataFrame:
     What: Strip whitespace, lowercase all letters, replace spaces with underscores.
     Why: Inconsistent column names can cause errors in processing and analysis.
     """
-    df = df.copy()  # Work on a copy to avoid warnings
-    df.columns = df.columns.str.strip().str.lower().str.replace(' ', '_')
+    df.columns = [_clean_name(col) for col in df.columns]
     print("Column names cleaned")
     return df
 
 # --- Function 3: Handle missing values and invalid numbers ---
-def handle_missing_and_invalid(df: pd.DataFrame) -> pd.DataFrame:
+def handle_missing_and_invalid(
+    df: pd.DataFrame,
+    last_date: Optional[pd.Timestamp] = None,
+    median_price: Optional[float] = None,
+) -> pd.DataFrame:
     """
     Convert numeric columns, handle missing or invalid values.
 
@@ -47,41 +127,94 @@ def handle_missing_and_invalid(df: pd.DataFrame) -> pd.DataFrame:
         - Replace missing prices with median price.
         - Replace missing qty with 1.
         - Convert negative qty to positive (treat as returned items).
-        - Replace zero or negative prices with median price.
-        - Convert 'date_sold' to datetime and fill missing dates forward.
+        - Store qty as integers when every quantity is a whole number.
+        - Replace zero or negative prices with median price. Pass the
+          file-wide `median_price` when cleaning in chunks; otherwise the
+          median of this frame is used.
+        - Convert 'date_sold' (YYYY-MM-DD) to datetime and fill missing dates forward.
+          `last_date` is the last date of the previous chunk, so a chunk
+          starting with missing dates continues the fill.
     Why:
         - Ensure all numeric columns are valid for analysis.
         - Maintain data integrity for sales calculations.
     """
-    df = df.copy()  # Work on a copy
+    # Convert numeric columns to plain float arrays (missing -> NaN) and fix
+    # them in place with numpy, one pass per fix instead of new Series each time
+    price = _to_float(df['price'])
+    qty = _to_float(df['qty'])
     
-    # Convert numeric columns
-    df['price'] = pd.to_numeric(df['price'], errors='coerce')
-    df['qty'] = pd.to_numeric(df['qty'], errors='coerce')
+    # Missing, zero or negative price -> median price (NaN fails `> 0` too)
+    if median_price is None:
+        valid_price = price[~np.isnan(price)]
+        if valid_price.size:
+            median_price = float(np.median(valid_price))
+        else:
+            median_price = np.nan
+            print("No valid prices found; rows without a valid price will be dropped")
+    np.copyto(price, median_price, where=~(price > 0))
+    df['price'] = price
     
-    # Fill missing or invalid price with median
-    median_price = df['price'].median()
-    df.loc[:, 'price'] = df['price'].fillna(median_price)
-    df.loc[df['price'] <= 0, 'price'] = median_price
+    # Fill missing qty with 1 and make negative qty positive; whole-number
+    # quantities are stored in the smallest integer type that fits
+    np.copyto(qty, 1.0, where=np.isnan(qty))
+    np.abs(qty, out=qty)
+    df['qty'] = pd.to_numeric(qty, downcast='integer')
     
-    # Fill missing qty with 1 and make negative qty positive
-    df.loc[:, 'qty'] = df['qty'].fillna(1).abs()
+    # Convert date_sold to datetime. A fixed format parses every value the
+    # same way instead of guessing per value; cache=True parses each
+    # distinct date string only once
+    date_text = df['date_sold'].str.strip()
+    dates = pd.to_datetime(
+        date_text, format=DATE_FORMAT, errors='coerce', cache=True
+    ).to_numpy()
+    missing_date = np.isnat(dates)
     
-    # Convert date_sold to datetime, forward fill missing dates
-    df.loc[:, 'date_sold'] = pd.to_datetime(df['date_sold'], errors='coerce')
-    df.loc[:, 'date_sold'] = df['date_sold'].ffill()
+    # Report dates that were given but are not in YYYY-MM-DD form
+    unparsed_rows = int(
+        (missing_date & date_text.fillna('').ne('').to_numpy()).sum()
+    )
+    if unparsed_rows > 0:
+        print(f"Could not parse {unparsed_rows} date_sold values "
+              f"(expected YYYY-MM-DD); treated them as missing")
     
-    # Drop rows where date_sold is still missing
-    initial_rows = len(df)
-    df = df.dropna(subset=['date_sold'])
-    removed_rows = initial_rows - len(df)
+    # Forward fill missing dates: each row takes the date of the latest
+    # non-missing row at or before it, found with one running maximum
+    # over the row numbers
+    if missing_date.any():
+        source_row = np.where(missing_date, 0, np.arange(len(dates)))
+        np.maximum.accumulate(source_row, out=source_row)
+        dates = dates[source_row]  # Leading missing rows stay NaT
+        if last_date is not None:
+            np.copyto(dates, last_date.to_datetime64(), where=np.isnat(dates))
+    df['date_sold'] = dates
+    
+    # Drop rows where date_sold is still missing, using one boolean mask;
+    # when nothing is missing the frame is kept as is instead of copied
+    missing_date = df['date_sold'].isna().to_numpy()
+    removed_rows = int(missing_date.sum())
     if removed_rows > 0:
+        df = df[~missing_date]
         print(f"Removed {removed_rows} rows with missing date_sold")
     
     print("Missing and invalid values handled")
     return df
 
 # --- Function 4: Clean text columns ---
+def _standardize_text(values: pd.Series) -> pd.Series:
+    """Run the whole text cleaning chain over one column in a single expression."""
+    # Missing names become 'Nan', as with a plain astype(str)
+    values = values.astype(TEXT_DTYPE).fillna('nan').str.strip()
+    if HAS_PYARROW:
+        # Arrow kernels only take plain patterns; a compiled regex or
+        # translate table would fall back to a Python loop
+        values = (
+            values.str.replace('"', '', regex=False)
+                  .str.replace(_ARROW_WS_PATTERN, ' ', regex=True)
+        )
+    else:
+        values = values.str.translate(_QUOTE_TABLE).str.replace(_WS_RE, ' ', regex=True)
+    return values.str.title()
+
 def clean_text_columns(df: pd.DataFrame) -> pd.DataFrame:
     """
     Standardize text columns (prodname, category).
@@ -91,21 +224,15 @@ def clean_text_columns(df: pd.DataFrame) -> pd.DataFrame:
         - Remove quotes
         - Replace multiple spaces with a single space
         - Convert to title case
+        - Store as 'category' dtype (integer codes + one copy of each name)
     Why:
         - Ensure product names and categories are consistent for grouping and analysis.
+        - With Arrow strings every step is a single kernel over the whole column.
+        - Grouping on category codes is much cheaper than hashing strings.
     """
-    df = df.copy()  # Work on a copy
-    
-    text_cols = ['prodname', 'category']
-    for col in text_cols:
-        if col in df.columns:
-            df.loc[:, col] = (
-                df[col].astype(str)
-                      .str.strip()
-                      .str.replace('"', '')
-                      .str.replace(r'\s+', ' ', regex=True)
-                      .str.title()
-            )
+    text_cols = [col for col in ['prodname', 'category'] if col in df.columns]
+    if text_cols:
+        df[text_cols] = df[text_cols].apply(_standardize_text).astype('category')
     
     print("Text columns cleaned")
     return df
@@ -116,29 +243,214 @@ def remove_duplicates(df: pd.DataFrame) -> pd.DataFrame:
     Group identical products (same prodname, category, price, date_sold)
     and sum their quantities.
 
-    What: Merge duplicate rows for accurate sales totals.
+    What: Merge duplicate rows for accurate sales totals. The four keys are
+          packed into one integer per row, rows are sorted once on it, and
+          the quantities of each run of equal keys are summed with numpy.
+          Rows with a missing key are dropped, as groupby(dropna=True) does.
     Why: Raw data may have multiple entries for the same product on the same day.
+         A groupby pays a lot of per-group overhead when most groups are tiny.
     """
     initial_rows = len(df)
+    key_cols = ['prodname', 'category', 'price', 'date_sold']
+    
+    # Replace each key by its rank among the sorted unique values
+    # (missing values get the code -1)
+    codes, sizes = [], []
+    for col in key_cols:
+        col_codes, uniques = pd.factorize(df[col], sort=True)
+        codes.append(col_codes)
+        sizes.append(len(uniques))
+    
+    # Rows with a missing key belong to no group; -1 would also corrupt
+    # the packed key below
+    has_key = np.logical_and.reduce([col_codes >= 0 for col_codes in codes])
+    if not has_key.all():
+        df = df[has_key]
+        codes = [col_codes[has_key] for col_codes in codes]
+    
+    if df.empty:
+        print(f"Removed {initial_rows} duplicate rows by grouping")
+        return df[key_cols + ['qty']].reset_index(drop=True)
+    
+    if np.prod(sizes, dtype=float) < 2 ** 63:
+        # Pack the ranks into one int64 key so a single argsort orders the rows
+        group_key = np.zeros(len(df), dtype=np.int64)
+        for col_codes, size in zip(codes, sizes):
+            group_key = group_key * size + col_codes
+        order = np.argsort(group_key, kind='stable')
+        sorted_key = group_key[order]
+        changed = sorted_key[1:] != sorted_key[:-1]
+    else:
+        # Too many combinations to pack: sort on all four ranks instead
+        order = np.lexsort(codes[::-1])  # lexsort uses the last key as primary
+        changed = np.zeros(len(df) - 1, dtype=bool)
+        for col_codes in codes:
+            sorted_codes = col_codes[order]
+            changed |= sorted_codes[1:] != sorted_codes[:-1]
     
-    # Make sure date_sold is in string format for grouping if it's datetime
-    df_group = df.copy()
+    # A new group starts wherever the key changes between sorted rows
+    starts = np.r_[0, np.flatnonzero(changed) + 1]
     
-    # Group by relevant columns
-    df_group = df_group.groupby(
-        ['prodname', 'category', 'price', 'date_sold'], 
-        as_index=False
-    )['qty'].sum()
+    df_group = df[key_cols].iloc[order[starts]].reset_index(drop=True)
+    # Sum small integer quantities in int64 so the totals cannot overflow
+    qty = df['qty'].to_numpy()
+    sum_dtype = np.int64 if qty.dtype.kind in 'iu' else None
+    df_group['qty'] = np.add.reduceat(qty[order], starts, dtype=sum_dtype)
     
     removed_duplicates = initial_rows - len(df_group)
     print(f"Removed {removed_duplicates} duplicate rows by grouping")
     
     return df_group
 
+# --- Function 6: Clean one chunk of raw data ---
+def clean_chunk(
+    df: pd.DataFrame,
+    last_date: Optional[pd.Timestamp] = None,
+    median_price: Optional[float] = None,
+) -> pd.DataFrame:
+    """
+    Apply every row-level cleaning step to one raw DataFrame.
+
+    What: Chains column cleaning, missing/invalid handling and text cleaning.
+    Why: Rows without a date are dropped before the (expensive) regex text
+         cleaning so it only sees the surviving rows. The steps modify the
+         frame in place, so one defensive copy is taken up front instead of
+         one per step; the caller's DataFrame is left untouched.
+    """
+    return (
+        df.copy()
+          .pipe(clean_column_names)
+          .pipe(handle_missing_and_invalid, last_date, median_price)
+          .pipe(clean_text_columns)
+    )
+
+# --- Function 7: Run the full cleaning pipeline ---
+def _merge_partials(partials: list) -> pd.DataFrame:
+    """Concatenate grouped results and group them again into one frame."""
+    # Each partial has its own categories, which concat would turn back into
+    # plain strings; merge them (sorted, so group order stays alphabetical)
+    merged = pd.concat(partials, ignore_index=True)
+    for col in ['prodname', 'category']:
+        merged[col] = union_categoricals(
+            [partial[col] for partial in partials], sort_categories=True
+        )
+    return remove_duplicates(merged)
+
+def run_pipeline(
+    chunks: Iterable[pd.DataFrame], median_price: Optional[float] = None
+) -> pd.DataFrame:
+    """
+    Clean a stream of raw chunks and merge them into one grouped DataFrame.
+
+    What: Cleans each chunk and groups its duplicates right away. Every
+          MERGE_EVERY chunks the grouped results are folded into one
+          running total, and a final fold gives the result.
+    Why: Only one raw chunk is held in memory at a time, plus the running
+         totals (one row per distinct product/price/date group), so files
+         larger than RAM can be cleaned. Pass `[df]` to clean a single
+         DataFrame. With several chunks, pass the file-wide `median_price`
+         (see compute_median_price) so every chunk fills prices the same way.
+    """
+    partials = []
+    total_rows = 0
+    total_chunks = 0
+    last_date = None
+    for chunk in chunks:
+        total_rows += len(chunk)
+        total_chunks += 1
+        chunk = clean_chunk(chunk, last_date, median_price)
+        if not chunk.empty:
+            last_date = chunk['date_sold'].iloc[-1]
+        partials.append(remove_duplicates(chunk))
+        # Duplicates can span chunks, so keep folding into the running total
+        if len(partials) > MERGE_EVERY:
+            partials = [_merge_partials(partials)]
+    
+    if not partials:
+        return pd.DataFrame()
+    print(f"Processed {total_rows} rows in {total_chunks} chunk(s)")
+    if len(partials) == 1:
+        return partials[0]
+    return _merge_partials(partials)
+
+# --- Function 8: Save cleaned data ---
+def save_data(df: pd.DataFrame, file_path: str) -> None:
+    """
+    Write the cleaned DataFrame to a CSV file.
+
+    What: Uses pyarrow's CSV writer when available, otherwise pandas to_csv.
+          Both quote only values that need it.
+    Why: pandas formats every cell in Python, which is often the slowest
+         step on large frames; Arrow formats whole columns in C++ threads.
+    """
+    if not HAS_PYARROW:
+        df.to_csv(file_path, index=False)
+        return
+    
+    table = pa.Table.from_pandas(df, preserve_index=False)
+    # date_sold holds calendar dates, so write them without a time part
+    date_idx = table.schema.get_field_index('date_sold')
+    if date_idx != -1:
+        table = table.set_column(
+            date_idx, 'date_sold', table.column(date_idx).cast(pa.date32())
+        )
+    # Arrow prints floats its own way (12 instead of 12.0, 1e-05 as 0.00001),
+    # so render float columns with numpy, which matches Python's repr as
+    # used by to_csv; missing values stay empty
+    for idx, field in enumerate(table.schema):
+        if pa.types.is_floating(field.type):
+            values = df[field.name].to_numpy(dtype=np.float64)
+            text = pa.array(values.astype(str), mask=np.isnan(values))
+            table = table.set_column(idx, field.name, text)
+    
+    # Arrow quotes every string (and the header) in its other quoting
+    # styles, so write the header ourselves and no quotes, like to_csv does
+    options = pacsv.WriteOptions(include_header=False, quoting_style='none')
+    try:
+        with pa.OSFile(file_path, 'wb') as sink:
+            sink.write((','.join(table.column_names) + '\n').encode())
+            pacsv.write_csv(table, sink, write_options=options)
+    except pa.ArrowInvalid:
+        # A value contains a comma, quote or newline; let pandas quote it
+        df.to_csv(file_path, index=False)
+
+# --- Function 9: Median price over the whole file ---
+def compute_median_price(chunks: Iterable[pd.DataFrame]) -> Optional[float]:
+    """
+    Compute the median of the valid prices across a stream of raw chunks.
+
+    What: Converts the price column of each chunk to floats and adds up how
+          often each valid price occurs; the exact median is then read off
+          the cumulative counts. Returns None if no price is valid.
+    Why: A per-chunk median would fill prices differently in every chunk.
+         Prices repeat a lot, so the counts stay small and memory stays
+         bounded however large the file is.
+    """
+    counts = pd.Series(dtype='int64')
+    for chunk in chunks:
+        prices = pd.Series(_to_float(chunk.rename(columns=_clean_name)['price']))
+        counts = counts.add(prices.value_counts(), fill_value=0)  # NaN not counted
+    
+    if counts.empty:
+        print("No valid prices found")
+        return None
+    
+    # Walk the cumulative counts of the sorted prices to the middle value(s)
+    counts = counts.sort_index()
+    cumulative = counts.cumsum().to_numpy()
+    total = int(cumulative[-1])
+    lower = counts.index[np.searchsorted(cumulative, (total - 1) // 2, side='right')]
+    upper = counts.index[np.searchsorted(cumulative, total // 2, side='right')]
+    return float((lower + upper) / 2)
+
 # --- Additional Function: Data validation report ---
 def generate_validation_report(df: pd.DataFrame) -> None:
     """
     Generate a simple validation report for the cleaned data.
+
+    Statistics come from one agg() call and the missing counts from one
+    numpy reduction, rather than describe(), which also sorts each column
+    for its quartiles.
     """
     print("\n=== DATA VALIDATION REPORT ===")
     print(f"Total rows: {len(df)}")
@@ -146,9 +458,10 @@ def generate_validation_report(df: pd.DataFrame) -> None:
     print("\nColumn names and data types:")
     print(df.dtypes)
     print("\nMissing values per column:")
-    print(df.isnull().sum())
+    print(pd.Series(df.isna().to_numpy().sum(axis=0), index=df.columns))
     print("\nBasic statistics:")
-    print(df[['price', 'qty']].describe())
+    print(df[['price', 'qty']].agg(['count', 'mean', 'std', 'min', 'max']))
+    print(f"\nTotal quantity sold: {df['qty'].sum()}")
 
 # --- Main block to run the cleaning pipeline ---
 if __name__ == "__main__":
@@ -159,28 +472,25 @@ if __name__ == "__main__":
     print("Starting data cleaning pipeline...")
     print("=" * 50)
     
-    # Step 1: Load raw data
-    df = load_data(raw_path)
+    # Ensure the output directory exists (once, before any chunk is read)
+    Path(cleaned_path).parent.mkdir(parents=True, exist_ok=True)
     
-    if df.empty:
-        print("No data loaded. Exiting...")
+    # Step 1: First pass over the price column for the file-wide median,
+    # then open the raw data as a stream of chunks
+    median_price = compute_median_price(
+        load_data(raw_path, chunksize=CHUNK_SIZE, columns=['price'])
+    )
+    if median_price is None:
+        print("No price to fill missing prices with. Exiting...")
         exit()
+    chunks = load_data(raw_path, chunksize=CHUNK_SIZE)
     
-    print(f"Initial data shape: {df.shape}")
-    print("\nInitial columns:")
-    print(df.columns.tolist())
-    
-    # Step 2: Standardize column names
-    df = clean_column_names(df)
+    # Steps 2-5: Clean column names, numeric values, text and duplicates
+    df = run_pipeline(chunks, median_price)
     
-    # Step 3: Clean text columns
-    df = clean_text_columns(df)
-    
-    # Step 4: Handle missing and invalid numeric values
-    df = handle_missing_and_invalid(df)
-    
-    # Step 5: Remove duplicate rows by grouping
-    df = remove_duplicates(df)
+    if df.empty:
+        print("No data loaded. Exiting...")
+        exit()
     
     # Step 6: Sort by date for better readability
     df = df.sort_values('date_sold', ascending=True).reset_index(drop=True)
@@ -189,18 +499,16 @@ if __name__ == "__main__":
     generate_validation_report(df)
     
     # Step 8: Save cleaned data
-    # Ensure the output directory exists
-    import os
-    os.makedirs(os.path.dirname(cleaned_path), exist_ok=True)
-    
-    df.to_csv(cleaned_path, index=False)
+    save_data(df, cleaned_path)
     print(f"\nCleaned data saved to: {cleaned_path}")
     
     print("\n" + "=" * 50)
     print("Cleaning complete. First few rows:")
     print(df.head())
     
-    # Optional: Show sample of cleaned data
+    # Optional: Show sample of cleaned data. Generator.choice picks 5 distinct
+    # rows without shuffling every row number, as df.sample(5) would
     print("\nSample of cleaned data (5 random rows):")
-    print(df.sample(5, random_state=42))
+    rng = np.random.default_rng(42)
+    print(df.take(rng.choice(len(df), size=min(5, len(df)), replace=False)))
 